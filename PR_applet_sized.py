@@ -23,16 +23,19 @@ Copyright (c) 2019, Martin Stoeckl
 """
 
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import *
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
+from tkinter import font as tkfont
 from tkinter import messagebox
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-import javabridge
-import bioformats
+import bioformats_helper
 
 from pyOTF import phaseretrieval_gui
 
@@ -74,14 +77,14 @@ class ParameterFrame(tk.Frame):
             # tk.Entry for the PSF file
             self.psf_file_entry = tk.Entry(self,
                                            textvariable=self.winfo_toplevel().psf_file,
-                                           font=("Arial", self.winfo_toplevel().font_size)
+                                           font=self.winfo_toplevel().font_regular
                                            )
             self.psf_file_entry.grid(row=0, column=0)
 
             # tk.Button, opens a filedialog to select the PSF file
             self.psf_button = tk.Button(self,
                                         text="Select PSF file",
-                                        font=("Arial", self.winfo_toplevel().font_size),
+                                        font=self.winfo_toplevel().font_regular,
                                         command=self.winfo_toplevel().select_psf_file
                                         )
             self.psf_button.grid(row=0, column=1, sticky=tk.E + tk.W, padx=5, pady=5)
@@ -89,14 +92,14 @@ class ParameterFrame(tk.Frame):
             # tk.Entry for the result directory
             self.result_dir_entry = tk.Entry(self,
                                              textvariable=self.winfo_toplevel().result_directory,
-                                             font=("Arial", self.winfo_toplevel().font_size)
+                                             font=self.winfo_toplevel().font_regular
                                              )
             self.result_dir_entry.grid(row=1, column=0)
 
             # tk.Button, opens a filedialog to select the result directory
             self.result_button = tk.Button(self,
                                            text="Select result directory",
-                                           font=("Arial", self.winfo_toplevel().font_size),
+                                           font=self.winfo_toplevel().font_regular,
                                            command=self.winfo_toplevel().select_result_dir
                                            )
             self.result_button.grid(row=1, column=1, sticky=tk.E + tk.W, padx=5, pady=5)
@@ -167,7 +170,7 @@ class ParameterFrame(tk.Frame):
             # Button to load the PSF parameters and date from the selected file
             self.load_psf_button = tk.Button(self,
                                              text="Load PSF",
-                                             font=("Arial", self.winfo_toplevel().font_size),
+                                             font=self.winfo_toplevel().font_regular,
                                              command=self.winfo_toplevel().load_psf_file,
                                              width=18
                                              )
@@ -176,7 +179,7 @@ class ParameterFrame(tk.Frame):
             # Button to start/stop the PR Algorithm
             self.pr_button = tk.Button(self,
                                        text="Start Phase Retrieval",
-                                       font=("Arial", self.winfo_toplevel().font_size),
+                                       font=self.winfo_toplevel().font_regular,
                                        command=self.winfo_toplevel().initiate_pr,
                                        width=18
                                        )
@@ -233,7 +236,7 @@ class ParameterFrame(tk.Frame):
             # Creates a label which displays the PR Algorithm status
             self.status_label = tk.Label(self,
                                          textvariable=self.winfo_toplevel().pr_state.current_state,
-                                         font=("Arial", self.winfo_toplevel().font_size),
+                                         font=self.winfo_toplevel().font_regular,
                                          anchor=tk.W,
                                          justify=tk.LEFT
                                          )
@@ -262,12 +265,12 @@ class ParameterFrame(tk.Frame):
                     row_grid: int
                         The row for the grid geometry manager to place the widgets on
                """
-            name_label = tk.Label(self, text=description, font=("Arial", self.winfo_toplevel().font_size), anchor=tk.E)
+            name_label = tk.Label(self, text=description, font=self.winfo_toplevel().font_regular, anchor=tk.E)
             name_label.grid(row=row_grid, column=0, sticky=tk.E, padx=2, pady=2)
 
             value_label = tk.Label(self,
                                    textvariable=value_variable,
-                                   font=("Arial", self.winfo_toplevel().font_size),
+                                   font=self.winfo_toplevel().font_regular,
                                    justify=tk.RIGHT,
                                    anchor=tk.E
                                    )
@@ -354,14 +357,14 @@ class ParameterFrame(tk.Frame):
         # Generate a name label in column 0
         name_label = tk.Label(parent,
                               text=parameter.name,
-                              font=("Arial", self.winfo_toplevel().font_size),
+                              font=self.winfo_toplevel().font_regular,
                               anchor=tk.E
                               )
         name_label.grid(row=row_grid, column=0, sticky=tk.E, padx=2, pady=2)
 
         # Generate a value entry in column 1
         value_entry = tk.Entry(parent, textvariable=parameter.value,
-                               font=("Arial", self.winfo_toplevel().font_size),
+                               font=self.winfo_toplevel().font_regular,
                                width=5,
                                justify=tk.RIGHT
                                )
@@ -369,7 +372,7 @@ class ParameterFrame(tk.Frame):
 
         # Generate a unit label in column 2
         unit_label = tk.Label(parent, text=parameter.unit,
-                              font=("Arial", self.winfo_toplevel().font_size),
+                              font=self.winfo_toplevel().font_regular,
                               anchor=tk.E
                               )
         unit_label.grid(row=row_grid, column=2, sticky=tk.E, padx=2, pady=2)
@@ -421,7 +424,7 @@ class ImageFrame(tk.Frame):
             self.zstack_slider = tk.Scale(self,
                                           label="Z Position",
                                           orient=tk.HORIZONTAL,
-                                          font=("Arial", self.winfo_toplevel().font_size),
+                                          font=self.winfo_toplevel().font_regular,
                                           variable=self.zpos,
                                           state=tk.DISABLED,
                                           name='z-slider'
@@ -434,7 +437,7 @@ class ImageFrame(tk.Frame):
             self.ypos_slider = tk.Scale(self,
                                         label="Y Position",
                                         orient=tk.HORIZONTAL,
-                                        font=("Arial", self.winfo_toplevel().font_size),
+                                        font=self.winfo_toplevel().font_regular,
 
                                         variable=self.ypos,
                                         state=tk.DISABLED,
@@ -595,7 +598,9 @@ class ZernikeFrame(tk.Frame):
     class ZernikeCoefficientFrame(tk.LabelFrame):
         """
         Displays the results of the Zernike Decomposition as discrete values. Generates a list of
-        Zernike Polynomials, with name, phase coefficient value
+        Zernike Polynomials, with name, phase coefficient value. All rows live in a single
+        ttk.Treeview, so updates only reconfigure existing rows instead of recreating three
+        tk.Labels per polynomial.
 
             Arguments
             ----------
@@ -608,61 +613,55 @@ class ZernikeFrame(tk.Frame):
             self.widgets()
 
         def widgets(self):
-            # Generate an entry for each Zernike Polynomial
-            rows = range(0, len(self.winfo_toplevel().zernike_results.zernike_polynomials))
-            for row, polynomial in zip(rows, self.winfo_toplevel().zernike_results.zernike_polynomials):
-                # Set the font to bold for the "important" polynomials
-                if polynomial.order in self.winfo_toplevel().zernike_results.important_coeff_orders:
-                    temp_label = tk.Label(self,
-                                          text=polynomial.name,
-                                          font=("Arial", self.winfo_toplevel().font_size, 'bold'),
-                                          anchor=tk.E
-                                          )
-                else:
-                    temp_label = tk.Label(self,
-                                          text=polynomial.name,
-                                          font=("Arial", self.winfo_toplevel().font_size),
-                                          anchor=tk.E
-                                          )
-                temp_label.grid(row=row, column=0, sticky=tk.E, pady=2)
+            # One Treeview holds name, value and status for all Zernike Polynomials
+            regular_font = self.winfo_toplevel().font_regular
+            bold_font = self.winfo_toplevel().font_bold
+
+            polynomials = self.winfo_toplevel().zernike_results.zernike_polynomials
+            self.tree = ttk.Treeview(self,
+                                     columns=('value', 'status'),
+                                     show='tree',
+                                     height=len(polynomials),
+                                     selectmode='none'
+                                     )
+            ttk.Style(self).configure('Treeview', font=regular_font, rowheight=regular_font.metrics('linespace') + 4)
+            self.tree.column('#0', anchor=tk.E, width=170)
+            self.tree.column('value', anchor=tk.E, width=60)
+            self.tree.column('status', anchor=tk.CENTER, width=70)
+
+            # Emphasise the "important" polynomials, color the in_tolerance status
+            self.tree.tag_configure('bold', font=bold_font)
+            self.tree.tag_configure('ok', foreground='green')
+            self.tree.tag_configure('notok', foreground='red')
+
+            # Generate one row per Zernike Polynomial, its order serves as row id
+            for polynomial in polynomials:
+                self.tree.insert('', tk.END, iid=str(polynomial.order), text=polynomial.name)
+            self.tree.grid(row=0, column=0, sticky=tk.E + tk.W, padx=5, pady=2)
+
+            self.update_entries()
 
-                # Format the phase coefficient value, make it bold if "important"
-                value_string = '  {:.2f}'.format(polynomial.value)
+        def update_entries(self):
+            # Reconfigure the existing rows in place, no widgets are destroyed
+            for polynomial in self.winfo_toplevel().zernike_results.zernike_polynomials:
+                tags = []
                 if polynomial.order in self.winfo_toplevel().zernike_results.important_coeff_orders:
-                    temp_label = tk.Label(self,
-                                          text=value_string,
-                                          font=("Arial", self.winfo_toplevel().font_size, 'bold'),
-                                          anchor=tk.E
-                                          )
-                else:
-                    temp_label = tk.Label(self,
-                                          text=value_string,
-                                          font=("Arial", self.winfo_toplevel().font_size),
-                                          anchor=tk.E
-                                          )
-                temp_label.grid(row=row, column=1, sticky=tk.E)
+                    tags.append('bold')
 
                 # If no results yet, in_tolerance is None --> don't display it
-                if polynomial.in_tolerance is not None:
-                    if polynomial.in_tolerance:
-                        temp_label = tk.Label(self,
-                                              text='OK!',
-                                              font=("Arial", self.winfo_toplevel().font_size),
-                                              fg='green'
-                                              )
-                    else:
-                        temp_label = tk.Label(self,
-                                              text='Not OK!',
-                                              font=("Arial", self.winfo_toplevel().font_size),
-                                              fg='red'
-                                              )
-                    temp_label.grid(row=row, column=2)
+                if polynomial.in_tolerance is None:
+                    status_text = ''
+                elif polynomial.in_tolerance:
+                    status_text = 'OK!'
+                    tags.append('ok')
+                else:
+                    status_text = 'Not OK!'
+                    tags.append('notok')
 
-        def update_entries(self):
-            # To update, destroy all label entries and recreate
-            for widget in self.winfo_children():
-                widget.destroy()
-            self.widgets()
+                self.tree.item(str(polynomial.order),
+                               values=('  {:.2f}'.format(polynomial.value), status_text),
+                               tags=tuple(tags)
+                               )
 
     class ResultButtonFrame(tk.LabelFrame):
         """
@@ -682,37 +681,42 @@ class ZernikeFrame(tk.Frame):
             # Check if the PR Algorithm has finished or been restarted, activate or deactivate report buttons
             self.winfo_toplevel().pr_state.pr_finished.trace('w', self.toggle_buttons)
 
-            # Buttons to trigger the saving functions
+            # Buttons to trigger the saving functions, pass the common options directly
+            # to the constructors instead of a second configure() pass over the children
+            button_options = dict(font=self.winfo_toplevel().font_regular,
+                                  state=tk.DISABLED,
+                                  width=23
+                                  )
+            self._last_state = tk.DISABLED
+
             self.save_pr_result_button = tk.Button(self,
                                                    text="Phase & Magnitude as .png",
                                                    command=self.save_pr_image,
+                                                   **button_options
                                                    )
             self.save_pr_result_button.grid(row=0, column=0, padx=5, pady=5, )
 
             self.save_zernike_img_button = tk.Button(self,
                                                      text="Zernike Coeff. as .png",
                                                      command=self.save_zd_image,
+                                                     **button_options
                                                      )
             self.save_zernike_img_button.grid(row=1, column=0, padx=5, pady=5, )
 
             self.save_zernike_values_button = tk.Button(self,
                                                         text="Save fit results as .xlsx",
                                                         command=self.save_zd_values,
+                                                        **button_options
                                                         )
             self.save_zernike_values_button.grid(row=0, column=1, padx=5, pady=5, )
 
             self.save_pdf_report = tk.Button(self,
                                              text="Create pdf report",
                                              command=self.generate_pdf_report,
+                                             **button_options
                                              )
             self.save_pdf_report.grid(row=1, column=1, padx=5, pady=5, )
 
-            for child_button in self.winfo_children():
-                child_button.configure(font=("Arial", self.winfo_toplevel().font_size),
-                                       state=tk.DISABLED,
-                                       width=23
-                                       )
-
         def toggle_buttons(self, n, m, x):
             """
             Switches the button to active when the PR Algorithm has finished, to inactive when a new PSF has been loaded.
@@ -726,19 +730,44 @@ class ZernikeFrame(tk.Frame):
             x: string
                 What operation triggered the trace: 'w': write, 'r': read or 'u': delete
             """
+            # Read the traced variable once instead of once per child widget
+            desired_state = tk.NORMAL if self.winfo_toplevel().pr_state.pr_finished.get() else tk.DISABLED
+
+            # Redundant writes to pr_finished don't change the state, skip the per-child Tcl calls
+            if getattr(self, '_last_state', None) == desired_state:
+                return
+            self._last_state = desired_state
+
             for child in self.winfo_children():
-                if self.winfo_toplevel().pr_state.pr_finished.get():
-                    child.configure(state=tk.NORMAL)
-                else:
-                    child.configure(state=tk.DISABLED)
+                child.configure(state=desired_state)
+
+        @staticmethod
+        def write_image_stream(save_file, stream):
+            """ Write an image stream to the disk with a large write buffer and a pre-sized file.
+
+                Arguments
+                ----------
+                save_file: string
+                    Full path of the .png file to write
+                stream: BytesIO
+                    Image stream holding the .png data
+            """
+            image_size = stream.getbuffer().nbytes
+            with open(save_file, "wb", buffering=1 << 20) as f:
+                # Pre-size the file to one contiguous extent where the OS supports it
+                try:
+                    os.posix_fallocate(f.fileno(), 0, image_size)
+                except (AttributeError, OSError):
+                    pass
+                stream.seek(0)
+                shutil.copyfileobj(stream, f, 1 << 20)
 
         def save_pr_image(self):
             """ Save the phase and magnitude images from the image stream to the disk. """
             save_file = os.path.join(self.winfo_toplevel().result_directory.get(),
                                      os.path.splitext(self.winfo_toplevel().psf_filename)[0] + '_pr_results.png')
             try:
-                with open(save_file, "wb") as f:
-                    f.write(self.winfo_toplevel().image_streams.pr_result_image_stream.getvalue())
+                self.write_image_stream(save_file, self.winfo_toplevel().image_streams.pr_result_image_stream)
             except FileNotFoundError as pop_up_alert:
                 messagebox.showwarning("Invalid File Path", str(pop_up_alert))
 
@@ -747,8 +776,7 @@ class ZernikeFrame(tk.Frame):
             save_file = os.path.join(self.winfo_toplevel().result_directory.get(),
                                      os.path.splitext(self.winfo_toplevel().psf_filename)[0] + '_zd_results.png')
             try:
-                with open(save_file, "wb") as f:
-                    f.write(self.winfo_toplevel().image_streams.zd_decomposition_image_stream.getvalue())
+                self.write_image_stream(save_file, self.winfo_toplevel().image_streams.zd_decomposition_image_stream)
             except FileNotFoundError as pop_up_alert:
                 messagebox.showwarning("Invalid File Path", str(pop_up_alert))
 
@@ -878,8 +906,12 @@ class MainWindow(tk.Tk):
     def __init__(self, screen_height, scaling_factor):
         tk.Tk.__init__(self)
 
-        # start a JVM, needed to run the bioformats class used in bioformats_helper.PsfImageDataAndParameters
-        javabridge.start_vm(class_path=bioformats.JARS)
+        # start a JVM in the background, needed to run the bioformats class used in
+        # bioformats_helper.PsfImageDataAndParameters - starting it synchronously would
+        # delay the window by several seconds
+        self._jvm_ready = threading.Event()
+        self._jvm_error = None
+        threading.Thread(target=self._start_jvm, daemon=True).start()
 
         # Set up the main window and font size and figure resolution according to the screen resolution
         # TODO: test this for different environments
@@ -894,6 +926,10 @@ class MainWindow(tk.Tk):
         self.font_size = int((30 * 1080) / (screen_height * self.scaling_factor))
         self.figure_dpi = int((180 * 1080) / screen_height)
 
+        # Shared font objects, Tk re-parses a ("Arial", size) tuple on every widget it is passed to
+        self.font_regular = tkfont.Font(family="Arial", size=self.font_size)
+        self.font_bold = tkfont.Font(family="Arial", size=self.font_size, weight='bold')
+
         # Instantiate the class tracking PSF and fit parameters
         self.psf_fit_parameters = TrackingClasses.PsfandFitParameters()
 
@@ -906,8 +942,10 @@ class MainWindow(tk.Tk):
         self.result_directory = tk.StringVar()
         self.result_directory.set('Select a result directory...')
 
-        # Instantiate the class tracking the state of the Phase Retrieval Algorithm
+        # Instantiate the class tracking the state of the Phase Retrieval Algorithm,
+        # worker updates are coalesced and flushed to the tk Vars on the mainloop
         self.pr_state = TrackingClasses.PrState()
+        self.pr_state.start_flushing(self)
 
         # Instantiate the class tracking the Phase Retrieval Algorithm results
         self.phase_retrieval_results = phaseretrieval_gui.PhaseRetrievalResult()
@@ -918,6 +956,9 @@ class MainWindow(tk.Tk):
         # Instantiate the class storing the GUI images as Bytestreams
         self.image_streams = TrackingClasses.ResultImageStreams()
 
+        # Long-lived pool for the parallel PNG encodes in display_pr_results
+        self._encoder_pool = ThreadPoolExecutor(max_workers=2)
+
         # Create the first level frames
         self.left_frame = ParameterFrame(self)
         self.left_frame.grid(row=0, column=0, sticky=tk.N)
@@ -926,6 +967,18 @@ class MainWindow(tk.Tk):
         self.right_frame = ZernikeFrame(self)
         self.right_frame.grid(row=0, column=2, sticky=tk.N)
 
+    def _start_jvm(self):
+        """Starts the JVM running bioformats, runs on a background thread. A startup failure is
+            stored for load_psf_file to report, the ready flag is set either way so the GUI
+            does not wait forever.
+        """
+        try:
+            bioformats_helper.ensure_vm()
+        except Exception as jvm_error:
+            self._jvm_error = jvm_error
+        finally:
+            self._jvm_ready.set()
+
     def select_psf_file(self):
         """ Open a filedialog to select a PSF file, store it"""
         psf_path = filedialog.askopenfilename(initialdir=self.psf_directory,
@@ -947,11 +1000,22 @@ class MainWindow(tk.Tk):
         Linked to the self.left_frame.action_button_frame.load_psf_button . Loads the PSF parameters and PSF data
             from the selected file and displays the data (self.middle_frame.psf_frame)
         """
+        # If the user is faster than the JVM startup, wait for it without blocking the event loop
+        if not self._jvm_ready.is_set():
+            self.pr_state.current_state.set("Waiting for the JVM to start...")
+            self.after(100, self.load_psf_file)
+            return
+        if self._jvm_error is not None:
+            self.pr_state.current_state.set("JVM could not be started")
+            messagebox.showwarning('JVM could not be started', str(self._jvm_error))
+            return
+        self.pr_state.current_state.set("Phase retrieval not started yet")
+
         # Load the PSF file store parameters and data
         self.psf_fit_parameters.read_data_and_parameters(self.psf_file.get())
 
         # If loading the PSF was successful...
-        if self.psf_fit_parameters.is_initiated:
+        if self.psf_fit_parameters.is_initiated.get():
             # ...display PSF on the GUI and initialize the sliders
             starting_zpos = self.psf_fit_parameters.z_size // 2
             self.middle_frame.psf_frame.zpos.set(starting_zpos)
@@ -1017,8 +1081,9 @@ class MainWindow(tk.Tk):
             self.left_frame.status_frame.update()
             self.after(250, self.check_pr_results)
 
-            # Update the GUI every five iterations
-            if self.pr_state.current_iter.get() > 0 and self.pr_state.current_iter.get() % 5 == 0:
+            # Update the GUI every five iterations, read the traced variable only once
+            current_iteration = self.pr_state.current_iter.get()
+            if current_iteration > 0 and current_iteration % 5 == 0:
                 self.display_pr_results()
 
         # If the thread has stopped, update the GUI display and reset the Phase Retrieval Button
@@ -1036,16 +1101,24 @@ class MainWindow(tk.Tk):
         """ Generates figures from the Phase Retrieval Algorithm Results and the differences in pupil function and mse.
             Stores the figures in the image streams and updates the GUI display
         """
-        # Create the Phase Retrieval result figure, store it as a byte stream and update GUI display
+        # Create the Phase Retrieval result and error figures
         result_figure, _ = self.phase_retrieval_results.plot_gui(self.figure_dpi)
-        self.image_streams.reset_image_stream(self.image_streams.pr_result_image_stream, result_figure)
-        self.middle_frame.pr_result_frame.show_results(result_figure)
-
-        # Plot the errors in a figure, store it as a byte stream and update GUI display
         mse_figure, _ = self.phase_retrieval_results.plot_convergence_gui(self.figure_dpi,
                                                                           self.psf_fit_parameters.
                                                                           max_iterations.value.get())
-        self.image_streams.reset_image_stream(self.image_streams.pr_fiterror_image_stream, mse_figure)
+
+        # Encode both figures into their byte streams in parallel, the PNG writer releases
+        # the GIL in zlib; resolving the futures waits for both and re-raises encode errors
+        encode_futures = [self._encoder_pool.submit(self.image_streams.reset_image_stream,
+                                                    self.image_streams.pr_result_image_stream, result_figure),
+                          self._encoder_pool.submit(self.image_streams.reset_image_stream,
+                                                    self.image_streams.pr_fiterror_image_stream, mse_figure),
+                          ]
+        for encode_future in encode_futures:
+            encode_future.result()
+
+        # update GUI display
+        self.middle_frame.pr_result_frame.show_results(result_figure)
         self.middle_frame.pr_mse_frame.show_results(mse_figure)
 
     def display_zd_results(self):
@@ -1069,9 +1142,8 @@ class MainWindow(tk.Tk):
         self.pr_thread.stop_pr.set()
 
     def clean_up(self):
-        """Ensures that the JVM is killed, before tk.root is destroyed"""
+        """Asks for confirmation before tk.root is destroyed, the JVM is killed atexit"""
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            javabridge.kill_vm()
             self.destroy()
 
 
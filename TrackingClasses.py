@@ -6,21 +6,58 @@ Classes mainly storing PSF parameters, and tracking current state and the result
 
 Copyright (c) 2019, Martin Stoeckl
 """
+import functools
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
-import xlsxwriter
+import numpy as np
 from io import BytesIO
 
 import tkinter as tk
 from tkinter import messagebox
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-
 from pyOTF import zernike
 from pyOTF import utils
 
-import bioformats_helper
+# xlsxwriter, reportlab and bioformats_helper (which pulls in javabridge) are imported
+# lazily in the methods that need them, keeping the import of this module cheap
+
+# Units of the parameters handed to phaseretrieval_gui.PhaseRetrievalThreaded, keyed by kwarg
+_UNITS = {'wl': 'nm', 'res': 'nm', 'zres': 'nm', 'phase_tol': 'λ'}
+
+# zernike.noll2name is constant, memoize the ordered (order, name) pairs once at import time
+_ORDERED_POLYNOMIALS = tuple(sorted(zernike.noll2name.items(), key=lambda kv: kv[0]))
+_ORDERED_COEFF_NAMES = [name for _, name in _ORDERED_POLYNOMIALS]
+
+@functools.lru_cache(maxsize=4)
+def _load_psf(psf_file_path, mtime, size):
+    """Read parameters and data from a PSF file, cached on (path, mtime, size) so re-opening
+        the same unchanged file skips the Bio-Formats/JVM round-trips and the OME-XML parse.
+
+        Arguments
+        ----------
+        psf_file_path: string
+            Full path of the PSF file
+        mtime: float
+            Modification time of the file, invalidates the cache when the file changes
+        size: int
+            Size of the file in bytes, invalidates the cache when the file changes
+
+        Returns
+        ----------
+        bioformats_helper.PsfImageDataAndParameters
+            image_data is cast to contiguous float32 - single precision halves the memory and
+            FFT bandwidth of the prepped volume, and casting here keeps the array identity
+            stable across reloads so the prep memo in PsfandFitParameters can hit
+    """
+    import bioformats_helper
+
+    psf_info = bioformats_helper.PsfImageDataAndParameters(psf_file_path)
+    psf_info.image_data = np.ascontiguousarray(psf_info.image_data, dtype=np.float32)
+    return psf_info
+
 
 class NamedParameters:
     """ Stores the relation between the kwarg needed for phaseretrieval_gui.PhaseRetrievalThreaded and the
@@ -39,10 +76,8 @@ class NamedParameters:
                         )
 
     def get_name(self, key):
-        try:
-            return self.__key_to_name[key]
-        except KeyError:
-            return ''
+        # a dict probe with default is cheaper than the try/except on misses
+        return self.__key_to_name.get(key, '')
 
 
 class PsfandFitParameters:
@@ -99,11 +134,25 @@ class PsfandFitParameters:
                 Value stored in tkinter Var for tracking
             self.unit: string
                 unit of stored value
+            self._cached_value: int or double
+                Plain Python mirror of the Var, updated by a write trace - reads skip the Tcl round-trip
         """
+        __slots__ = ('name', 'value', 'unit', '_cached_value')
+
         def __init__(self, name, value, unit):
             self.name = name
             self.value = value
             self.unit = unit
+            self._cached_value = value.get()
+            value.trace_add('write', self._sync_cached_value)
+
+        def _sync_cached_value(self, *_):
+            # entries mid-edit can hold text a Var cannot parse - invalidate the mirror then,
+            # so verify() rejects the run instead of silently using a stale value
+            try:
+                self._cached_value = self.value.get()
+            except tk.TclError:
+                self._cached_value = 0
 
     def __init__(self):
         self.parameter_names = NamedParameters()
@@ -129,7 +178,6 @@ class PsfandFitParameters:
                                           )
 
         self.psf_data = None
-        self.psf_data_prepped = None
         self.xy_size = None
         self.z_size = None
 
@@ -157,19 +205,26 @@ class PsfandFitParameters:
                                                     )
         self.phase_tolerance.value.set(0.5)
 
-        self.is_initiated = False
+        self.is_initiated = tk.BooleanVar()
+        self.is_initiated.set(False)
+        self._prep_executor = ThreadPoolExecutor(max_workers=1)
+        self._prep_future = None
+        self._prep_cache = {}
 
     def read_data_and_parameters(self, psf_file_path):
         """Read PSF file and write acquisition parameters and PSF data to attributes and sets self.is_initiated flag.
+            The data preparation for the PR Algorithm runs on a worker thread, so the Tk event loop stays responsive;
+            is_initiated is a tk.BooleanVar, widgets can trace it instead of polling.
 
             Arguments
             ----------
             psf_file_path: string
                 Full path of the PSF file
         """
-        self.is_initiated = False
+        self.is_initiated.set(False)
         try:
-            psf_info = bioformats_helper.PsfImageDataAndParameters(psf_file_path)
+            file_stats = os.stat(psf_file_path)
+            psf_info = _load_psf(psf_file_path, file_stats.st_mtime, file_stats.st_size)
         except AssertionError as pop_up_alert:
             messagebox.showwarning('PSF file parameters or data not read correctly', str(pop_up_alert))
         except Exception as pop_up_alert:
@@ -181,9 +236,69 @@ class PsfandFitParameters:
             self.z_res.value.set(psf_info.pixel_size_z)
             self.xy_size = psf_info.image_size_xy
             self.z_size = psf_info.image_size_z
+            # already cast to float32 by _load_psf, same object for repeated loads of one file
             self.psf_data = psf_info.image_data
-            self.psf_data_prepped = utils.prep_data_for_PR(self.psf_data, self.xy_size * 2)
-            self.is_initiated = True
+
+            # Zero-padding and FFT-shifting the PSF stack is memory-bound, keep it off the main thread
+            self._prep_future = self._prep_executor.submit(self._prep_psf_data,
+                                                           self.psf_data,
+                                                           self.xy_size * 2
+                                                           )
+            self.is_initiated.set(True)
+
+    def _prep_psf_data(self, psf_data, prep_size):
+        """Prepare the PSF data for the phase retrieval, runs on the prep executor.
+            Results are memoized on (id(psf_data), prep_size), so reopening the same PSF skips the FFT pass.
+
+            Arguments
+            ----------
+            psf_data: ndarray (3 dim)
+                The raw PSF data
+            prep_size: int
+                Size of the prepared data (2 * xy_size)
+
+            Returns
+            ----------
+            ndarray (3 dim)
+                The prepared PSF data
+        """
+        cache_key = (id(psf_data), prep_size)
+        if cache_key not in self._prep_cache:
+            # only the latest prepped volume is kept, it is 8x the size of the raw data
+            self._prep_cache = {cache_key: utils.prep_data_for_PR(psf_data, prep_size)}
+        return self._prep_cache[cache_key]
+
+    @property
+    def psf_data_prepped(self):
+        """The raw data prepared for the phase retrieval, blocks until the prep worker is done.
+
+            Returns
+            ----------
+            ndarray (3 dim) or None
+                The prepared PSF data, None if no PSF file was loaded yet
+        """
+        if self._prep_future is None:
+            return None
+        return self._prep_future.result()
+
+    def _snapshot(self):
+        """Collects all psf and fit parameters from their trace-updated mirrors, no Tcl round-trips.
+
+               Returns
+               ----------
+               dict
+                   Dictionary, mapping the phaseretrieval_gui.PhaseRetrievalThreaded kwargs
+                   to their current values
+        """
+        return dict(wl=self.em_wavelength._cached_value,
+                    na=self.num_aperture._cached_value,
+                    ni=self.refractive_index._cached_value,
+                    res=self.xy_res._cached_value,
+                    zres=self.z_res._cached_value,
+                    max_iters=self.max_iterations._cached_value,
+                    pupil_tol=self.pupil_tolerance._cached_value,
+                    mse_tol=self.mse_tolerance._cached_value,
+                    )
 
     def verify(self):
         """Checks whether any psf or fit parameters is zero or PSF data is not shaped correctly.
@@ -193,21 +308,19 @@ class PsfandFitParameters:
             bool
                 True, if no zero value in the parameters and correct PSF data shape
         """
-        parameters_initialized = (self.em_wavelength.value.get(),
-                                  self.num_aperture.value.get(),
-                                  self.refractive_index.value.get(),
-                                  self.xy_res.value.get(),
-                                  self.z_res.value.get(),
-                                  self.max_iterations.value.get(),
-                                  self.pupil_tolerance.value.get(),
-                                  self.mse_tolerance.value.get(),
-                                  )
+        parameters_initialized = self._snapshot().values()
         try:
             assert all(parameters_initialized), \
                 'Not all PSF or Fit parameters initialized correctly.'
 
             assert self.psf_data.shape == (self.z_size, self.xy_size, self.xy_size), \
                 'PSF data array is not shaped correctly.'
+
+            assert self._prep_future is not None, \
+                'PSF data has not been prepared.'
+
+            # waits for the prep worker, usually already finished when the fit is started
+            self._prep_future.result()
         except AssertionError as pop_up_alert:
             messagebox.showwarning('Invalid PSF parameters', str(pop_up_alert))
             return False
@@ -224,12 +337,8 @@ class PsfandFitParameters:
                    dict
                        Dictionary, mapping kwargs to their parameters
         """
-        return dict(wl=self.em_wavelength.value.get(),
-                    na=self.num_aperture.value.get(),
-                    ni=self.refractive_index.value.get(),
-                    res=self.xy_res.value.get(),
-                    zres=self.z_res.value.get(),
-                    )
+        snapshot = self._snapshot()
+        return {key: snapshot[key] for key in ('wl', 'na', 'ni', 'res', 'zres')}
 
     @property
     def fit_parameter_dict(self):
@@ -241,10 +350,8 @@ class PsfandFitParameters:
                dict
                    Dictionary, mapping kwargs to their parameters
         """
-        return dict(max_iters=self.max_iterations.value.get(),
-                    pupil_tol=self.pupil_tolerance.value.get(),
-                    mse_tol=self.mse_tolerance.value.get(),
-                    )
+        snapshot = self._snapshot()
+        return {key: snapshot[key] for key in ('max_iters', 'pupil_tol', 'mse_tol')}
 
     @property
     def voxel_aspect(self):
@@ -255,60 +362,66 @@ class PsfandFitParameters:
                double
                    Aspect ratio z / xy
         """
-        return self.z_res.value.get() / float(self.xy_res.value.get())
+        return self.z_res._cached_value / float(self.xy_res._cached_value)
 
 
 class ZernikeDecomposition:
-    """Stores the results of the Zernike Polynomial Decomposition.
+    """Stores the results of the Zernike Polynomial Decomposition in structure-of-arrays layout,
+        so the tolerance check runs vectorized and the reports can write whole columns at once.
 
         Attributes
         ----------
-        self.zernike_names_dict : dict
-            A dict mapping polynomial name to polynomial order (Noll)
-        self.ordered_coeff_names : list
+        _ORDERED : tuple
+            (order, name) pairs from zernike.noll2name sorted in raising order, computed once at import
+        ordered_coeff_names : list
             Sorted list of polynomial names in raising order
-        self.zernike_polynomials : list
-            List of Zernike Polynomial contributions (List of ZernikePolynomial)
-        self.important_coeff_orders : tuple
-            Tuple of orders of Zernike Polynomials which are emphasised in GUI and reports
+        self.orders : ndarray (1 dim)
+            Polynomial orders (Noll) in raising order
+        self.names : list
+            Polynomial names (Noll) in raising order
+        self.values : ndarray (1 dim)
+            Values of the phase coefficients (in units of wavelength)
+        self.in_tolerance : ndarray (1 dim, bool)
+            Whether each value is smaller than the set phase tolerance
+        self.has_results : bool
+            False until a decomposition arrived, row views report in_tolerance as None then
+        self.important_coeff_orders : frozenset
+            Orders of Zernike Polynomials which are emphasised in GUI and reports
     """
-    class ZernikePolynomial:
-        """Zernike Polynomial object, stores the results of the decomposition for each polynomial.
 
-          Attributes
-          ----------
-            self.order: int
-                Order of the polynomial (Noll)
-            self.name: string
-                Name of the polynomial (Noll)
-            self.value: double
-                Value of the phase coefficient (in units of wavelength)
-            self.in_tolerance: bool
-                Whether value is greater or smaller the set phase tolerance (PsfandFitParameters.phase_tolerance.value)
-        """
-        def __init__(self, order, name, value, in_tolerance):
-            self.order = order
-            self.name = name
-            self.value = value
-            self.in_tolerance = in_tolerance
+    # shared module-level constants, ordered once at import instead of per instantiation
+    _ORDERED = _ORDERED_POLYNOMIALS
+    ordered_coeff_names = _ORDERED_COEFF_NAMES
+    _n_coeffs = len(ordered_coeff_names)
+
+    # Lightweight row view over the arrays, keeps the per-polynomial loops in GUI and reports working
+    ZernikePolynomial = namedtuple('ZernikePolynomial', ('order', 'name', 'value', 'in_tolerance'))
 
     def __init__(self):
-        self.zernike_names_dict = zernike.noll2name
-        self.ordered_coeff_names = [self.zernike_names_dict[i + 1] for i in range(len(self.zernike_names_dict))]
-        self.zernike_polynomials = []
-        self.important_coeff_orders = (5, 6, 7, 8, 11)
+        self.orders = np.fromiter((order for order, _ in self._ORDERED), dtype=int, count=self._n_coeffs)
+        self.names = list(self.ordered_coeff_names)
+        self.important_coeff_orders = frozenset((5, 6, 7, 8, 11))
         self.initialize_polynomial_list()
 
     def initialize_polynomial_list(self):
-        """Populate initial Zernike Polynomial list and sort it in ascending order."""
-        self.zernike_polynomials = []
-        for order, name in self.zernike_names_dict.items():
-            self.zernike_polynomials.append(self.ZernikePolynomial(order, name, 0, None))
-        self.zernike_polynomials.sort(key=lambda p: p.order)
+        """Reset the decomposition results to zeroed arrays."""
+        self.values = np.zeros(self._n_coeffs)
+        self.in_tolerance = np.zeros(self._n_coeffs, dtype=bool)
+        self.has_results = False
+
+    @property
+    def zernike_polynomials(self):
+        """List of per-polynomial row views in raising order (List of ZernikePolynomial)."""
+        if self.has_results:
+            tolerance_flags = self.in_tolerance.tolist()
+        else:
+            tolerance_flags = [None] * self._n_coeffs
+        return [self.ZernikePolynomial(order, name, value, flag)
+                for (order, name), value, flag in zip(self._ORDERED, self.values.tolist(), tolerance_flags)]
 
     def decomposition_from_phase_retrieval(self, pr_results, phase_tolerance):
         """ Get Zernike Decompostion results from Phase Retrieval Results,
-            update polynomialial list with phase coefficients
+            update the coefficient arrays with the phase coefficients
 
             Arguments
             ----------
@@ -317,43 +430,107 @@ class ZernikeDecomposition:
             phase_tolerance: double
                 Tolerance level for the phase coefficient of the zernike polynomials
         """
-        ordered_phase_coefficients = pr_results.zd_result.pcoefs[:len(self.ordered_coeff_names)]
-        for polynomial, phase_coefficient in zip(self.zernike_polynomials, ordered_phase_coefficients):
-            polynomial.value = phase_coefficient
-            polynomial.in_tolerance = (abs(phase_coefficient) < phase_tolerance)
+        # Compare all phase coefficients against the tolerance in one vectorized pass
+        self.values = np.asarray(pr_results.zd_result.pcoefs[:self._n_coeffs], dtype=float)
+        self.in_tolerance = np.abs(self.values) < phase_tolerance
+        self.has_results = True
 
 
 class PrState:
-    """Stores the current state of the Phase Retrieval Algorithm.
+    """Stores the current state of the Phase Retrieval Algorithm. The state attributes wrap their
+        tk Vars in CoalescedVariables, so the unmodified PR worker can keep calling .set() per
+        iteration - the values are only recorded as pending and written to the tk Vars in one shot
+        by the periodic flush on the Tk mainloop, at most ~30 times per second.
 
         Attributes
         ----------
-        self.current_state : tk.StringVar
+        self.current_state : CoalescedVariable (tk.StringVar)
             Verbose tracking of the current state (used for GUI display and reports)
-        self.current_iter : tk.IntVar
+        self.current_iter : CoalescedVariable (tk.IntVar)
             Current iteration of the Phase Retrieval Algorithm
-        self.current_pupil_diff : tk.DoubleVar
+        self.current_pupil_diff : CoalescedVariable (tk.DoubleVar)
             Current difference between subsequent pupil functions
-        self.current_mse_diff : tk.DoubleVar
+        self.current_mse_diff : CoalescedVariable (tk.DoubleVar)
             Current difference between subsequent mean square error calculations
-        self.pr_finished: tk.BooleanVar
+        self.pr_finished: CoalescedVariable (tk.BooleanVar)
 
     """
+    class CoalescedVariable:
+        """Wraps a tk.Var: set() only records the value as pending, everything else - get(),
+            trace(), the Tcl name handed to variable=/textvariable= options - is forwarded to
+            the wrapped Var, so widget bindings keep working.
+        """
+        __slots__ = ('_var', '_attribute_name', '_pr_state')
+
+        def __init__(self, pr_state, attribute_name, var):
+            self._var = var
+            self._attribute_name = attribute_name
+            self._pr_state = pr_state
+
+        def set(self, new_value):
+            self._pr_state.update(**{self._attribute_name: new_value})
+
+        def get(self):
+            return self._var.get()
+
+        def __getattr__(self, name):
+            return getattr(self._var, name)
+
+        def __str__(self):
+            return str(self._var)
+
     def __init__(self):
-        self.current_state = tk.StringVar()
-        self.current_state.set("Phase retrieval not started yet")
-        self.current_iter = tk.IntVar()
-        self.current_pupil_diff = tk.DoubleVar()
-        self.current_mse_diff = tk.DoubleVar()
-        self.pr_finished = tk.BooleanVar()
-        self.pr_finished.set(False)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+        self.current_state = self.CoalescedVariable(self, 'current_state',
+                                                    tk.StringVar(value="Phase retrieval not started yet"))
+        self.current_iter = self.CoalescedVariable(self, 'current_iter', tk.IntVar())
+        self.current_pupil_diff = self.CoalescedVariable(self, 'current_pupil_diff', tk.DoubleVar())
+        self.current_mse_diff = self.CoalescedVariable(self, 'current_mse_diff', tk.DoubleVar())
+        self.pr_finished = self.CoalescedVariable(self, 'pr_finished', tk.BooleanVar(value=False))
 
     def reset_state(self):
+        with self._pending_lock:
+            self._pending.clear()
         self.current_iter.set(0)
         self.current_pupil_diff.set(0)
         self.current_mse_diff.set(0)
         self.pr_finished.set(False)
 
+    def update(self, **pending_values):
+        """Store state updates without crossing into Tcl, safe to call from the PR worker thread.
+            The pending values are written to the tk Vars in one shot by the periodic flush,
+            so hundreds of per-iteration .set() calls collapse to at most ~30 updates per second.
+
+            Arguments
+            ----------
+            pending_values:
+                Attribute names of the state variables (current_iter, current_pupil_diff, ...)
+                with new values
+        """
+        with self._pending_lock:
+            self._pending.update(pending_values)
+
+    def start_flushing(self, root, interval_ms=33):
+        """Register the periodic flush of pending updates on the Tk mainloop.
+
+            Arguments
+            ----------
+            root: tk.Tk
+                The GUI root, provides the after() scheduling
+            interval_ms: int
+                Flush interval in milliseconds
+        """
+        self._flush(root, interval_ms)
+
+    def _flush(self, root, interval_ms):
+        with self._pending_lock:
+            pending_values, self._pending = self._pending, {}
+        for attribute_name, value in pending_values.items():
+            getattr(self, attribute_name)._var.set(value)
+        root.after(interval_ms, self._flush, root, interval_ms)
+
 
 class ResultImageStreams:
     """Provides Byte streams to store the figures as .png for display and reports.
@@ -377,6 +554,7 @@ class ResultImageStreams:
         self.pr_result_image_stream = BytesIO()
         self.pr_fiterror_image_stream = BytesIO()
         self.zd_decomposition_image_stream = BytesIO()
+        self._reader_cache = {}
 
     def reset_image_stream(self, stream, image):
         """Resets the image stream if the image changes
@@ -387,18 +565,48 @@ class ResultImageStreams:
                 image: plt.Figure
                     New matplotlib.Figure to store in the Stream
             """
-        stream.truncate()
+        self._reader_cache.pop(id(stream), None)
+        # Rewind first - truncate() cuts at the current position, the old order left the
+        # tail of a previously larger image in the buffer
         stream.seek(0)
-        image.savefig(stream, dpi=300, format='png')
+        stream.truncate()
+        # The pdf report draws these images at most a few hundred points wide,
+        # 300 dpi was 4-8x oversampled for every consumer
+        image.savefig(stream, dpi=150, format='png')
 
+    def get_reader(self, stream):
+        """Returns a reportlab ImageReader for an image stream, the decoded image is cached
+           until the stream is rewritten, so re-created reports skip the .png decode.
+
+            Arguments
+            ----------
+                stream: BytesIO
+                    Internal BytesIO holding the .png data
+
+            Returns
+            ----------
+            ImageReader
+        """
+        from reportlab.lib.utils import ImageReader
 
-class ZdResultWorkbook(xlsxwriter.Workbook):
+        stream_size = stream.getbuffer().nbytes
+        cached = self._reader_cache.get(id(stream))
+        if cached is None or cached[0] != stream_size:
+            stream.seek(0)
+            cached = (stream_size, ImageReader(stream))
+            self._reader_cache[id(stream)] = cached
+        return cached[1]
+
+
+class ZdResultWorkbook:
     """Creates a .xlsx-file to store the PSF and Fit parameters and the Zernike decomposition results
 
         Attributes
         ----------
         save_path: string
             Full path to store the .xlsx-file
+        self.workbook: xlsxwriter.Workbook
+            The workbook written to the disk
         self.psf_path: string
             Full path to the PSF-file
         self.zernike_results: ZernikeDecomposition
@@ -416,7 +624,11 @@ class ZdResultWorkbook(xlsxwriter.Workbook):
     def __init__(self, save_path, psf_path, zernike_results, pr_state, psf_fit_parameters=None,
                  psf_param_dict=None, fit_param_dict=None):
 
-        super(ZdResultWorkbook, self).__init__(save_path)
+        import xlsxwriter
+
+        # constant_memory serializes each row to disk once it is left, keeping memory bounded in
+        # batch runs - add_entries therefore writes in strictly ascending row order
+        self.workbook = xlsxwriter.Workbook(save_path, {'constant_memory': True})
 
         self.psf_path = psf_path
         self.zernike_results = zernike_results
@@ -427,8 +639,8 @@ class ZdResultWorkbook(xlsxwriter.Workbook):
 
         self.parameter_names = NamedParameters()
 
-        self.bold_format = self.add_format({'bold': True})
-        self.short_number_format = self.add_format()
+        self.bold_format = self.workbook.add_format({'bold': True})
+        self.short_number_format = self.workbook.add_format()
         self.short_number_format.set_num_format('0.00')
 
         if self.psf_fit_parameters is not None:
@@ -436,51 +648,62 @@ class ZdResultWorkbook(xlsxwriter.Workbook):
 
             self.fit_param_dict = self.psf_fit_parameters.fit_parameter_dict
 
-        self.worksheet = self.add_worksheet('Zernike decomposition')
+        self.worksheet = self.workbook.add_worksheet('Zernike decomposition')
         self.add_entries()
-        self.close()
+        self.workbook.close()
 
     def add_entries(self):
-        def add_parameter_entries(start_row, start_col, param_dict):
-            parameters = param_dict.items()
-            for (param_key, param_value), current_row in zip(parameters,
-                                                             range(start_row, start_row + len(param_dict))
-                                                             ):
-                if param_key in ('wl', 'res', 'zres'):
-                    unit = 'nm'
-                elif param_key == 'phase_tol':
-                    unit = 'λ'
-                else:
-                    unit = ''
-                if unit:
-                    self.worksheet.write(current_row, start_col, self.parameter_names.get_name(param_key) + ' in ' + unit)
-                else:
-                    self.worksheet.write(current_row, start_col, self.parameter_names.get_name(param_key))
-                self.worksheet.write(current_row, start_col + 1, param_value)
-
-        self.worksheet.write(0, 0, self.psf_path, self.bold_format)
-        self.worksheet.write(2, 0, 'PSF Parameters', self.bold_format)
-        add_parameter_entries(3, 0, self.psf_param_dict)
-
-        self.worksheet.write(2, 2, 'Phase Retrieval Parameters', self.bold_format)
-        add_parameter_entries(3, 2, self.fit_param_dict)
+        # Bind the hot attribute lookups once, each write below is a plain call
+        write = self.worksheet.write
+        write_row = self.worksheet.write_row
+        get_name = self.parameter_names.get_name
+
+        def parameter_rows(param_dict):
+            rows = []
+            for param_key, param_value in param_dict.items():
+                unit = _UNITS.get(param_key, '')
+                label = '{} in {}'.format(get_name(param_key), unit) if unit else get_name(param_key)
+                rows.append((label, param_value))
+            return rows
+
+        psf_rows = parameter_rows(self.psf_param_dict)
+        fit_rows = parameter_rows(self.fit_param_dict)
 
         current_iteration_string = "Phase retrieval stopped after iteration {} out of {}.".format(
             self.pr_state.current_iter.get(), self.fit_param_dict['max_iters'])
-        self.worksheet.write(6, 2, current_iteration_string)
         pr_state_string = self.pr_state.current_state.get().replace("\n", " ")
-        self.worksheet.write(7, 2, pr_state_string, self.bold_format)
 
-        self.worksheet.write(9, 0, 'Zernike Decomposition Results', self.bold_format)
-        self.worksheet.write(10, 0, 'Noll Order', self.bold_format)
-        self.worksheet.write(10, 1, 'Noll Name', self.bold_format)
-        self.worksheet.write(10, 2, 'Value', self.bold_format)
-
-        for polynomial, row in zip(self.zernike_results.zernike_polynomials,
-                                range(len(self.zernike_results.zernike_polynomials))):
-            self.worksheet.write(row + 11, 0, polynomial.order)
-            self.worksheet.write(row + 11, 1, polynomial.name)
-            self.worksheet.write(row + 11, 2, polynomial.value, self.short_number_format)
+        write(0, 0, self.psf_path, self.bold_format)
+        write(2, 0, 'PSF Parameters', self.bold_format)
+        write(2, 2, 'Phase Retrieval Parameters', self.bold_format)
+
+        # both parameter blocks share rows 3-7, interleaved so no row is revisited once left;
+        # the stop condition strings fill the right-hand column below the fit parameters
+        for row_offset, psf_row in enumerate(psf_rows):
+            current_row = 3 + row_offset
+            write_row(current_row, 0, psf_row)
+            if row_offset < len(fit_rows):
+                write_row(current_row, 2, fit_rows[row_offset])
+            elif current_row == 6:
+                write(current_row, 2, current_iteration_string)
+            elif current_row == 7:
+                write(current_row, 2, pr_state_string, self.bold_format)
+
+        write(9, 0, 'Zernike Decomposition Results', self.bold_format)
+        write(10, 0, 'Noll Order', self.bold_format)
+        write(10, 1, 'Noll Name', self.bold_format)
+        write(10, 2, 'Value', self.bold_format)
+
+        # the Zernike block goes out row by row straight from the coefficient arrays,
+        # column writes would revisit serialized rows in constant_memory mode
+        zernike_rows = zip(self.zernike_results.orders.tolist(),
+                           self.zernike_results.names,
+                           self.zernike_results.values.tolist()
+                           )
+        for current_row, (order, name, value) in enumerate(zernike_rows, start=11):
+            write(current_row, 0, order)
+            write(current_row, 1, name)
+            write(current_row, 2, value, self.short_number_format)
 
 class PdfReport:
     """Creates a .xlsx-file to store the PSF and Fit parameters and the Zernike decomposition results
@@ -501,6 +724,11 @@ class PdfReport:
                 State of the Phase Retrieval Algorithm
 
         """
+
+    # Order in which the parameter entries appear on the report
+    _PSF_PARAM_ORDER = ('em_wavelength', 'num_aperture', 'refractive_index', 'xy_res', 'z_res')
+    _FIT_PARAM_ORDER = ('max_iterations', 'pupil_tolerance', 'mse_tolerance', 'phase_tolerance')
+
     def __init__(self, save_path, psf_path, psf_parameters, zernike_results, image_streams, pr_state):
         self.save_path = save_path
         _, self.psf_filename = os.path.split(psf_path)
@@ -510,6 +738,7 @@ class PdfReport:
         self.pr_state = pr_state
 
     def create_pdf_report(self):
+        from reportlab.pdfgen import canvas
 
         def generate_psf_entry(ypos, parameter):
             xpos_name = 370
@@ -517,18 +746,18 @@ class PdfReport:
             xpos_unit = 550
 
             c.drawString(xpos_name, ypos, parameter.name)
-            c.drawRightString(xpos_value, ypos, str(parameter.value.get()))
+            c.drawRightString(xpos_value, ypos, str(parameter._cached_value))
             c.drawString(xpos_unit, ypos, parameter.unit)
 
-        # read image data from Bytestream
-        psf_xy_image = ImageReader(self.image_streams.psf_image_stream_xy)
-        psf_xz_image = ImageReader(self.image_streams.psf_image_stream_xz)
-        pr_res_image = ImageReader(self.image_streams.pr_result_image_stream)
-        pr_mse_image = ImageReader(self.image_streams.pr_fiterror_image_stream)
-        zd_res_image = ImageReader(self.image_streams.zd_decomposition_image_stream)
+        # read image data from Bytestream, readers are cached until a stream is rewritten
+        psf_xy_image = self.image_streams.get_reader(self.image_streams.psf_image_stream_xy)
+        psf_xz_image = self.image_streams.get_reader(self.image_streams.psf_image_stream_xz)
+        pr_res_image = self.image_streams.get_reader(self.image_streams.pr_result_image_stream)
+        pr_mse_image = self.image_streams.get_reader(self.image_streams.pr_fiterror_image_stream)
+        zd_res_image = self.image_streams.get_reader(self.image_streams.zd_decomposition_image_stream)
 
         # initialize Canvas
-        c = canvas.Canvas(self.save_path)
+        c = canvas.Canvas(self.save_path, pageCompression=1)
 
         # draw Headers and add PSF-filename
         c.setFont('Helvetica-Bold', 16)
@@ -543,35 +772,30 @@ class PdfReport:
         c.setFont('Helvetica-Bold', 12)
         c.drawString(370, 730, "PSF & Fit parameters")
 
-        # list PSF and PR parameters
+        # list PSF and PR parameters, both blocks run downwards in 17 pt steps
         c.setFont('Helvetica', 10)
-        generate_psf_entry(710, self.psf_parameters.em_wavelength)
-        generate_psf_entry(693, self.psf_parameters.num_aperture)
-        generate_psf_entry(676, self.psf_parameters.refractive_index)
-        generate_psf_entry(659, self.psf_parameters.xy_res)
-        generate_psf_entry(642, self.psf_parameters.z_res)
-        generate_psf_entry(617, self.psf_parameters.max_iterations)
-        generate_psf_entry(600, self.psf_parameters.pupil_tolerance)
-        generate_psf_entry(583, self.psf_parameters.mse_tolerance)
-        generate_psf_entry(566, self.psf_parameters.phase_tolerance)
+        for line, attribute in enumerate(self._PSF_PARAM_ORDER):
+            generate_psf_entry(710 - 17 * line, getattr(self.psf_parameters, attribute))
+        for line, attribute in enumerate(self._FIT_PARAM_ORDER):
+            generate_psf_entry(617 - 17 * line, getattr(self.psf_parameters, attribute))
 
         # show PSFs
         c.setFont('Helvetica', 10)
         c.drawString(100, 710, "PSF x/y")
         c.drawString(230, 710, "PSF x/z")
-        c.drawImage(psf_xy_image, 100, 585, width=120, height=120, mask=None)
-        c.drawImage(psf_xz_image, 230, 585, width=120, height=120, mask=None)
+        c.drawImage(psf_xy_image, 100, 585, width=120, height=120)
+        c.drawImage(psf_xz_image, 230, 585, width=120, height=120)
 
         # show PR Results (Results and Errors)
         c.setFont('Helvetica-Bold', 12)
         c.drawString(100, 550, "Phase retrieval results")
-        c.drawImage(pr_res_image, 100, 390, width=360, height=150, mask=None)
-        c.drawImage(pr_mse_image, 100, 325, width=288, height=72, mask=None)
+        c.drawImage(pr_res_image, 100, 390, width=360, height=150)
+        c.drawImage(pr_mse_image, 100, 325, width=288, height=72)
 
         # setup description, why in which iteration the PR Algorithm terminated
         c.setFont('Helvetica', 8)
         condition_strings = self.pr_state.current_state.get().split('\n')
-        max_iters = self.psf_parameters.max_iterations.value.get()
+        max_iters = self.psf_parameters.max_iterations._cached_value
         if len(condition_strings) == 1:
             condition_string = "{} after {} iterations.".format(condition_strings[0][:-1],
                                                                 self.pr_state.current_iter.get())
@@ -588,28 +812,33 @@ class PdfReport:
         # list results of the Zernike Polynomial Decomposition
         c.setFont('Helvetica-Bold', 12)
         c.drawString(100, 310, "Zernike decomposition results")
-        c.drawImage(zd_res_image, 100, 60, width=240, height=240, mask=None)
+        c.drawImage(zd_res_image, 100, 60, width=240, height=240)
         c.setFont('Helvetica-Bold', 10)
         c.drawString(350, 285, "Zernike Polynomial")
         c.drawString(520, 285, "Value / λ")
 
         y_pos = 265
+        current_font = None
         for polynomial in self.zernike_results.zernike_polynomials:
-            c.setFillColorRGB(0, 0, 0)
             if polynomial.order in self.zernike_results.important_coeff_orders:
                 font = 'Helvetica-Bold'
             else:
                 font = 'Helvetica'
-            c.setFont(font, 10)
+
+            # Only touch the canvas font state when it actually changes
+            if font != current_font:
+                c.setFont(font, 10)
+                current_font = font
+
+            c.setFillColorRGB(0, 0, 0)
             c.drawString(350, y_pos, polynomial.name)
             if polynomial.in_tolerance:
                 c.setFillColorRGB(0.22, 0.67, 0.15)
             else:
                 c.setFillColorRGB(0.9, 0.07, 0.07)
-            string_width = c.stringWidth("{:.2f}".format(polynomial.value), font, 10)
 
-            # string_width pos value: 19.46, neg value = 22.79, needed for right alignment
-            c.drawString(520 + 22.79 - string_width, y_pos, "{:.2f}".format(polynomial.value))
+            # drawRightString aligns natively, no per-row stringWidth bookkeeping needed
+            c.drawRightString(542.79, y_pos, "{:.2f}".format(polynomial.value))
             y_pos -= 17
 
         # print time at the end
@@ -7,12 +7,36 @@ The javabridge JVM running bioformatshas to be started in the script before
 
 Copyright (c) 2019, Martin Stoeckl
 """
+import atexit
+import os
+import threading
+
 import javabridge
 import bioformats
 import numpy as np
-import imghdr
 import imageio
-import xml.etree.ElementTree as ET
+
+# lxml parses multi-MB OME-XML blocks 2-3x faster, the stdlib parser is the fallback
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+_vm_lock = threading.Lock()
+_vm_started = False
+
+
+def ensure_vm():
+    """Start the javabridge JVM running bioformats once per process, safe to call repeatedly and
+        from any thread. The JVM is killed via atexit, callers must not kill it themselves.
+    """
+    global _vm_started
+    with _vm_lock:
+        if not _vm_started:
+            javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
+            atexit.register(javabridge.kill_vm)
+            _vm_started = True
 
 
 class PsfImageDataAndParameters:
@@ -24,6 +48,24 @@ class PsfImageDataAndParameters:
                        'air': 1.,
                        }
 
+    # map OME PixelType entries to numpy dtypes
+    __pixel_type_to_dtype = {'int8': np.int8,
+                             'uint8': np.uint8,
+                             'int16': np.int16,
+                             'uint16': np.uint16,
+                             'int32': np.int32,
+                             'uint32': np.uint32,
+                             'float': np.float32,
+                             'double': np.float64,
+                             }
+
+    # suffix of the on-disk cache written next to the PSF file
+    _CACHE_SUFFIX = '.prpcache.npz'
+
+    # scalar attributes stored in the cache besides the image data
+    _CACHED_PARAMETERS = ('pixel_size_xy', 'pixel_size_z', 'image_size_xy', 'image_size_z',
+                          'numerical_aperture', 'refractive_index')
+
     def __init__(self, image_path):
         self.pixel_size_xy = 0
         self.pixel_size_z = 0
@@ -32,7 +74,64 @@ class PsfImageDataAndParameters:
         self.numerical_aperture = 0.
         self.refractive_index = 0.
         self.image_data = None
-        self.read_psf_params_and_data(image_path)
+        if not self._load_from_cache(image_path):
+            self.read_psf_params_and_data(image_path)
+            self._write_cache(image_path)
+
+    def _load_from_cache(self, image_path):
+        """Load the image parameters and data from the on-disk cache if it is newer than the PSF file.
+
+                Parameters
+                ----------
+                image_path : string
+                    Full path to the PSF image file
+
+                Returns
+                -------
+                bool
+                    True if all attributes were restored from the cache
+        """
+        cache_path = image_path + self._CACHE_SUFFIX
+        try:
+            if os.path.getmtime(cache_path) < os.path.getmtime(image_path):
+                return False
+            with np.load(cache_path) as cached:
+                self.image_data = cached['image_data']
+                self.pixel_size_xy = int(cached['pixel_size_xy'])
+                self.pixel_size_z = int(cached['pixel_size_z'])
+                self.image_size_xy = int(cached['image_size_xy'])
+                self.image_size_z = int(cached['image_size_z'])
+                self.numerical_aperture = float(cached['numerical_aperture'])
+                self.refractive_index = float(cached['refractive_index'])
+        except Exception:
+            # any unreadable cache (truncated zip, missing key, wrong content, ...) falls back
+            # to a fresh read - the cache must never be able to break loading the PSF itself
+            return False
+        return True
+
+    def _write_cache(self, image_path):
+        """Store the image parameters and data next to the PSF file, stale or unwritable caches
+            are simply skipped - the cache is purely an optimization for re-runs.
+
+                Parameters
+                ----------
+                image_path : string
+                    Full path to the PSF image file
+        """
+        cache_path = image_path + self._CACHE_SUFFIX
+        cached_parameters = {name: getattr(self, name) for name in self._CACHED_PARAMETERS}
+        # write to a temporary file and rename it into place, so an interrupted write cannot
+        # leave a newer-than-source but corrupt cache behind (the .npz suffix keeps np.savez
+        # from appending its own)
+        temp_path = cache_path + '.tmp.npz'
+        try:
+            np.savez(temp_path, image_data=self.image_data, **cached_parameters)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
 
 
     def read_psf_params_and_data(self, image_path):
@@ -61,19 +160,25 @@ class PsfImageDataAndParameters:
                     The measured intensities of a PSF
         """
 
-        # Check file format, bioformats compatible microscopy images and ome-tiffs supported
-        file_format = imghdr.what(image_path)
+        # Dispatch on the file suffix, bioformats compatible microscopy images and ome-tiffs supported;
+        # .lsm files are tiff containers too but keep their own suffix and go through bioformats
+        file_extension = os.path.splitext(image_path)[1].lower()
+
+        # Pixel data already read by tifffile, skips the bioformats read at the end
+        tiff_image_data = None
+
+        if file_extension in ('.tif', '.tiff'):
+            # OME-tiffs don't need the JVM at all, tifffile reads OME-XML and planes directly
+            try:
+                import tifffile
+            except ImportError:
+                tifffile = None
 
-        if file_format == 'tiff':
-            # .lsm images return "tiff" as file_format, read with bioformats anyway
-            if image_path.endswith('.lsm'):
-                javabridge.attach()
-                try:
-                    metadata = bioformats.get_omexml_metadata(image_path, )
-                except:
-                    raise AssertionError('File format not supported')
-                finally:
-                    javabridge.detach()
+            if tifffile is not None:
+                with tifffile.TiffFile(image_path) as tiff_file:
+                    metadata = tiff_file.ome_metadata
+                    assert metadata is not None, 'Only OME-tif file format is supported'
+                    tiff_image_data = tiff_file.asarray()
 
             # read tiff-metadata and extract "description" tag, in case of ome-tif it is OME compliant
             else:
@@ -82,8 +187,9 @@ class PsfImageDataAndParameters:
                 metadata = metadata['description']
                 assert metadata is not None, 'Only OME-tif file format is supported'
 
-        # not a tiff image, but a ome-bioformats supported container
+        # not a plain tiff image, but a ome-bioformats supported container
         else:
+            ensure_vm()
             javabridge.attach()
             try:
                 metadata = bioformats.get_omexml_metadata(image_path,)
@@ -92,82 +198,84 @@ class PsfImageDataAndParameters:
             finally:
                 javabridge.detach()
 
-        # parse metadata string
-        ome_xml = bioformats.OMEXML(metadata)
+        # parse metadata string once with ET, the handful of attributes needed below is read straight
+        # from the tree instead of building the full bioformats.OMEXML object model;
+        # passed as bytes since lxml rejects strings carrying an encoding declaration
+        ome_root = ET.fromstring(metadata.encode('utf-8'))
+        namespace = ome_root.tag.split('}')[0][1:] if ome_root.tag.startswith('{') else ''
 
-        # Retrieve information about the image
-        ome_pixel_information = ome_xml.image(0).Pixels
+        ome_pixel_information = ome_root.find('.//{{{}}}Pixels'.format(namespace))
+        assert ome_pixel_information is not None, 'No Pixels entry found in the OME metadata'
+        pixels = ome_pixel_information.get
 
         # assert pixels and images are square, pixels are scaled and the unit is recognizable
-        assert ome_pixel_information.PhysicalSizeX == ome_pixel_information.PhysicalSizeY, \
+        assert float(pixels('PhysicalSizeX')) == float(pixels('PhysicalSizeY')), \
             'Identical pixel size required for X and Y'
 
-        assert ome_pixel_information.PhysicalSizeXUnit in ('um', 'µm', 'micron', 'nm'), \
+        assert pixels('PhysicalSizeXUnit') in ('um', 'µm', 'micron', 'nm'), \
             'Unit of pixel size not recognized: Must be um, µm, micron or, nm)'
 
-        assert ome_pixel_information.PhysicalSizeZUnit in ('um', 'µm', 'micron', 'nm'), \
+        assert pixels('PhysicalSizeZUnit') in ('um', 'µm', 'micron', 'nm'), \
             'Unit of z-step not recognized: Must be um, µm, micron or, nm)'
 
-        assert ome_pixel_information.SizeC == 1 and ome_pixel_information.SizeT == 1, \
+        assert int(pixels('SizeC')) == 1 and int(pixels('SizeT')) == 1, \
             'Only single channel images  and no time series are supported'
 
-        assert ome_pixel_information.SizeX == ome_pixel_information.SizeY, \
+        assert int(pixels('SizeX')) == int(pixels('SizeY')), \
             'Images with equal pixel numbers for X and Y are required'
 
         # Get pixel size, convert to nm
-        px_size_xy = float(ome_pixel_information.PhysicalSizeX)
-        if ome_pixel_information.PhysicalSizeXUnit in ('um', 'µm', 'micron'):
+        px_size_xy = float(pixels('PhysicalSizeX'))
+        if pixels('PhysicalSizeXUnit') in ('um', 'µm', 'micron'):
             px_size_xy *= 1000
         self.pixel_size_xy = int(px_size_xy)
 
         # Get z step, convert to nm
-        px_size_z = float(ome_pixel_information.PhysicalSizeZ)
-        if ome_pixel_information.PhysicalSizeZUnit in ('um', 'µm', 'micron'):
+        px_size_z = float(pixels('PhysicalSizeZ'))
+        if pixels('PhysicalSizeZUnit') in ('um', 'µm', 'micron'):
             px_size_z *= 1000
         self.pixel_size_z = int(px_size_z)
 
         # Get image / stack size
-        self.image_size_xy = int(ome_pixel_information.SizeX)
-        self.image_size_z = int(ome_pixel_information.SizeZ)
-
-        # Retrieve information about the objective
-        ome_instrument_information = ome_xml.instrument()
+        self.image_size_xy = int(pixels('SizeX'))
+        self.image_size_z = int(pixels('SizeZ'))
 
         # Get the numerical aperture of the objective
-        na = float(ome_instrument_information.Objective.LensNA)
+        objective = ome_root.find('.//{{{}}}Objective'.format(namespace))
+        assert objective is not None, 'No Objective entry found in the OME metadata'
+        na = float(objective.get('LensNA'))
         if na >= 1:
             self.numerical_aperture = round(na, 3)
         else:
             self.numerical_aperture = round(na, 2)
 
-        # Refractive index / Immersion is not part of the ome_xml.instrument() model, parse xml with ET
-        ome_root = ET.fromstring(metadata)
-
-        # search parsed xml, for refractive index or immersion (convert to refractive index)
-        for element in ome_root:
-            if 'Image' in element.tag:
-                for sub_element in element:
-                    if 'ObjectiveSettings' in sub_element.tag:
-                        refr_index = sub_element.get('RefractiveIndex')
-                        if refr_index is not None:
-                            self.refractive_index = float(refr_index)
-                        else:
-                            for element in ome_root:
-                                if 'Instrument' in element.tag:
-                                    for sub_element in element:
-                                        if 'Objective' in sub_element.tag:
-                                            immersion = sub_element.get('Immersion')
-                                            if immersion is not None:
-                                                try:
-                                                    self.refractive_index = self.__immersion_to_ri[immersion.lower()]
-                                                except KeyError:
-                                                    pass
-        # store image data in a numpy array
-        temp_data = []
-        with bioformats.ImageReader(image_path) as reader:
-            for z_pos in range(self.image_size_z):
-                temp_data.append(reader.read(c=0, z=z_pos, rescale=False))
-        self.image_data = np.asarray(temp_data)
+        # query the parsed xml for refractive index or immersion (convert to refractive index)
+        objective_settings = ome_root.find('.//{{{}}}ObjectiveSettings'.format(namespace))
+        refr_index = objective_settings.get('RefractiveIndex') if objective_settings is not None else None
+        if refr_index is not None:
+            self.refractive_index = float(refr_index)
+        else:
+            immersion = objective.get('Immersion')
+            if immersion is not None:
+                self.refractive_index = self.__immersion_to_ri.get(immersion.lower(), self.refractive_index)
+        # pixel data was already read by tifffile, just enforce the expected stack shape
+        if tiff_image_data is not None:
+            self.image_data = tiff_image_data.reshape((self.image_size_z, self.image_size_xy, self.image_size_xy))
+
+        # store image data in a numpy array preallocated with the dtype declared in the OME
+        # PixelType entry, each plane is read directly into its z-slice
+        else:
+            image_dtype = self.__pixel_type_to_dtype.get(pixels('Type'), np.float32)
+            self.image_data = np.empty((self.image_size_z, self.image_size_xy, self.image_size_xy),
+                                       dtype=image_dtype)
+            ensure_vm()
+            javabridge.attach()
+            try:
+                with bioformats.ImageReader(image_path) as reader:
+                    for z_pos in range(self.image_size_z):
+                        self.image_data[z_pos] = reader.read(c=0, z=z_pos, rescale=False)
+            finally:
+                javabridge.detach()
 
 
 
@@ -1,16 +1,13 @@
 import os
+import threading
 import time
-import copy
+from concurrent.futures import ThreadPoolExecutor
 
 import argparse
-import javabridge
-import bioformats
 
-import bioformats_helper
-from TrackingClasses import ZdResultWorkbook, ZernikeDecomposition
-
-from pyOTF import phaseretrieval_gui
-from pyOTF import utils
+# numpy, bioformats_helper, TrackingClasses and pyOTF are imported inside process_psf_file -
+# they pull in the JVM bindings, tkinter and matplotlib, which would make --help and argparse
+# errors take seconds
 
 
 class PrState:
@@ -28,9 +25,13 @@ class PrState:
            self.current_mse_diff : Variable
                Current difference between subsequent mean square error calculations
            self.pr_finished: Variable
+           self.iteration_done : threading.Event
+               Signaled whenever the worker stores a new iteration count, wakes the progress loop
     """
     class Variable:
         """ Needed to emulate tk.Var behavior. """
+        __slots__ = ('_value',)
+
         def __init__(self, value=None):
             self._value = value
 
@@ -40,9 +41,22 @@ class PrState:
         def set(self, new_value):
             self._value = new_value
 
+    class SignalingVariable(Variable):
+        """ Variable which additionally signals an Event on every set. """
+        __slots__ = ('_signal',)
+
+        def __init__(self, signal, value=None):
+            super().__init__(value)
+            self._signal = signal
+
+        def set(self, new_value):
+            super().set(new_value)
+            self._signal.set()
+
     def __init__(self):
+        self.iteration_done = threading.Event()
         self.current_state = self.Variable("Phase retrieval not started yet")
-        self.current_iter = self.Variable(0)
+        self.current_iter = self.SignalingVariable(self.iteration_done, 0)
         self.current_pupil_diff = self.Variable(0)
         self.current_mse_diff = self.Variable(0)
         self.pr_finished = self.Variable(False)
@@ -52,13 +66,15 @@ class PrState:
         self.current_pupil_diff.set(0)
         self.current_mse_diff.set(0)
         self.pr_finished.set(False)
+        self.iteration_done.clear()
 
 
 def retrieve_pupil_phase():
     # Generate help and define parameters
     argument_parser = argparse.ArgumentParser(description='Retrieve the complex pupil function from a PSF by a '
                                                           'Phase Retrieval algorithm')
-    argument_parser.add_argument("psf_file_path", type=str, help='PSF for analysis, OME-TIFF or bioformats supported')
+    argument_parser.add_argument("psf_file_paths", type=str, nargs='+',
+                                 help='PSF(s) for analysis, OME-TIFF or bioformats supported')
     argument_parser.add_argument("em_wl", type=int, help='Central emission wavelength in nm')
     argument_parser.add_argument("--refr_index", type=float, help='Sample refractive index')
     argument_parser.add_argument("--num_aper", type=float, help='Numerical aperture of the objective')
@@ -69,14 +85,6 @@ def retrieve_pupil_phase():
 
     arguments = argument_parser.parse_args()
 
-    # Set_file_path
-    psf_dir, psf_name = os.path.split(arguments.psf_file_path)
-
-    # retrieve PSF parameters and PSF data from file
-    javabridge.start_vm(class_path=bioformats.JARS)
-    psf_parameters_data = bioformats_helper.PsfImageDataAndParameters(os.path.join(arguments.psf_file_path))
-    javabridge.kill_vm()
-
     # Check if entered parameters are valid...
     assert arguments.em_wl > 0, "Emission wavelength must be greater than zero."
     assert arguments.refr_index is None or arguments.refr_index > 0, "Refractive index must be greater than zero."
@@ -86,15 +94,37 @@ def retrieve_pupil_phase():
                                                                      "greater than zero."
     assert arguments.mse_diff is None or arguments.mse_diff > 0, "MSE difference must be greater than zero."
 
-    # ... and if all needed parameters are there.
+    # the JVM is started on demand by bioformats_helper and reused for all files, killed atexit
+    for psf_file_path in arguments.psf_file_paths:
+        print("Processing {}".format(psf_file_path))
+        process_psf_file(psf_file_path, arguments)
+
+
+def process_psf_file(psf_file_path, arguments):
+    import numpy as np
+
+    import bioformats_helper
+    from TrackingClasses import ZdResultWorkbook, ZernikeDecomposition
+
+    from pyOTF import phaseretrieval_gui
+    from pyOTF import utils
+
+    # Set_file_path
+    psf_dir, psf_name = os.path.split(psf_file_path)
+
+    # retrieve PSF parameters and PSF data from file
+    psf_parameters_data = bioformats_helper.PsfImageDataAndParameters(os.path.join(psf_file_path))
+
+    # Check if all needed parameters are there.
     assert any((arguments.refr_index, psf_parameters_data.refractive_index)), "Please provide a value " \
                                                                               "for the refractive index."
     assert any((arguments.num_aper, psf_parameters_data.numerical_aperture)), "Please provide a value "\
                                                                               "for the numerical aperture."
 
-    # prep psf data
-    psf_data = psf_parameters_data.image_data
+    # prep psf data, single precision halves memory and FFT bandwidth as in the GUI path
+    psf_data = np.ascontiguousarray(psf_parameters_data.image_data, dtype=np.float32)
     psf_data_prepped = utils.prep_data_for_PR(psf_data, psf_parameters_data.image_size_xy * 2)
+    psf_data_prepped = psf_data_prepped.astype(np.float32, copy=False)
 
     # set up model params
     final_na = arguments.num_aper if arguments.num_aper is not None else psf_parameters_data.numerical_aperture
@@ -107,7 +137,7 @@ def retrieve_pupil_phase():
                       zres=psf_parameters_data.pixel_size_z
                       )
     # make a copy which is not changed by phaseretrieval_gui.PhaseRetrievalThreaded
-    psf_params_copy = copy.copy(psf_params)
+    psf_params_copy = dict(psf_params)
 
     pr_params = dict(max_iters=arguments.iters,
                      pupil_tol=arguments.pupil_diff,
@@ -136,11 +166,11 @@ def retrieve_pupil_phase():
     phase_retrieval_thread.daemon = True
     phase_retrieval_thread.start()
 
-    # Follow progress
-    old_iteration = 0
+    # Follow progress, the worker signals iteration_done whenever it stores a new iteration count -
+    # the main thread sleeps between iterations instead of polling
     while phase_retrieval_thread.is_alive():
-        current_iteration = phase_retrieval_state.current_iter.get()
-        if current_iteration > old_iteration:
+        if phase_retrieval_state.iteration_done.wait(timeout=1.0):
+            phase_retrieval_state.iteration_done.clear()
             print('Current iteration: {}/{}, Current pupil function diff: {:.2E}, Current mse diff: {:.2E}'.
                   format(
                         phase_retrieval_state.current_iter.get(),
@@ -149,42 +179,47 @@ def retrieve_pupil_phase():
                         phase_retrieval_state.current_mse_diff.get()
                         )
             )
-        time.sleep(0.25)
-        old_iteration = copy.copy(current_iteration)
     print("It took {} seconds to retrieve the pupil function".format(time.time() - pr_start))
     print(phase_retrieval_state.current_state.get())
 
-    # plot
-    results, _ = phase_retrieval_results.plot()
-    result_name = os.path.splitext(psf_name)[0] + '_pr_results.png'
-    results.savefig(os.path.join(psf_dir, result_name))
-
-    convergence, _ = phase_retrieval_results.plot_convergence()
-    convergence_name = os.path.splitext(psf_name)[0] + '_pr_convergence.png'
-    convergence.savefig(os.path.join(psf_dir, convergence_name))
-
-    # fit to zernikes
-    zd_start = time.time()
-    print("Starting zernike decomposition")
-    phase_retrieval_results.fit_to_zernikes(120)
-    print("It took {} seconds to fit 120 Zernikes".format(time.time() - zd_start))
-
-    zernike, _ = phase_retrieval_results.zd_result.plot_named_coefs()
-    zernike_name = os.path.splitext(psf_name)[0] + '_zd_results.png'
-    zernike.savefig(os.path.join(psf_dir, zernike_name))
-
-
-    zernike_results.decomposition_from_phase_retrieval(phase_retrieval_results, 0.5)
-    phase_coeff_name = os.path.splitext(psf_name)[0] + '_zd_results.xlsx'
-    phase_coeff_path = os.path.join(psf_dir, phase_coeff_name)
-
-    ZdResultWorkbook(phase_coeff_path,
-                     arguments.psf_file_path,
-                     zernike_results,
-                     phase_retrieval_state,
-                     psf_param_dict=psf_params_copy,
-                     fit_param_dict=pr_params,
-                    )
+    # save the result figures and the workbook on a thread pool, so the PNG encodes overlap the
+    # Zernike fit and each other - Agg rasterization is thread-safe for distinct figures
+    with ThreadPoolExecutor(max_workers=4) as saver_pool:
+        # plot
+        results, _ = phase_retrieval_results.plot()
+        result_name = os.path.splitext(psf_name)[0] + '_pr_results.png'
+        save_futures = [saver_pool.submit(results.savefig, os.path.join(psf_dir, result_name))]
+
+        convergence, _ = phase_retrieval_results.plot_convergence()
+        convergence_name = os.path.splitext(psf_name)[0] + '_pr_convergence.png'
+        save_futures.append(saver_pool.submit(convergence.savefig, os.path.join(psf_dir, convergence_name)))
+
+        # fit to zernikes
+        zd_start = time.time()
+        print("Starting zernike decomposition")
+        phase_retrieval_results.fit_to_zernikes(120)
+        print("It took {} seconds to fit 120 Zernikes".format(time.time() - zd_start))
+
+        zernike, _ = phase_retrieval_results.zd_result.plot_named_coefs()
+        zernike_name = os.path.splitext(psf_name)[0] + '_zd_results.png'
+        save_futures.append(saver_pool.submit(zernike.savefig, os.path.join(psf_dir, zernike_name)))
+
+        zernike_results.decomposition_from_phase_retrieval(phase_retrieval_results, 0.5)
+        phase_coeff_name = os.path.splitext(psf_name)[0] + '_zd_results.xlsx'
+        phase_coeff_path = os.path.join(psf_dir, phase_coeff_name)
+
+        save_futures.append(saver_pool.submit(ZdResultWorkbook,
+                                              phase_coeff_path,
+                                              psf_file_path,
+                                              zernike_results,
+                                              phase_retrieval_state,
+                                              psf_param_dict=psf_params_copy,
+                                              fit_param_dict=pr_params,
+                                              ))
+
+        # re-raise any save error instead of letting a future swallow it
+        for save_future in save_futures:
+            save_future.result()
 
 if __name__ == "__main__":
     retrieve_pupil_phase()